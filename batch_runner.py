@@ -0,0 +1,177 @@
+import json
+import time
+
+# Batch Settings
+BATCH_POLL_INTERVAL = 30  # Seconds between batch job status checks
+BATCH_DONE_STATES = {"JOB_STATE_SUCCEEDED", "JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED"}
+INLINE_BATCH_BYTES = 15_000_000  # Payload per inlined batch job, kept under the API's ~20 MB cap
+MAX_ITEM_RETRIES = 2  # Resubmissions of a failed turn before its chat is marked failed
+
+def render_contents(speaker, messages):
+    """Render the shared chat history as seen by one speaker (own turns as model, others as user)"""
+    contents = []
+    for message in messages:
+        if message["name"] == speaker:
+            role, text = "model", message["content"]
+        else:
+            role, text = "user", f"{message['name']}: {message['content']}"
+        # Merge consecutive turns of the same role into one content block
+        if contents and contents[-1]["role"] == role:
+            contents[-1]["parts"][0]["text"] += "\n\n" + text
+        else:
+            contents.append({"role": role, "parts": [{"text": text}]})
+    return contents
+
+class BatchChat:
+    """A round-robin group chat stepped one turn at a time, outside autogen's synchronous loop"""
+    def __init__(self, chat_id, agents, initial_message, max_round=12, admin_name="Admin"):
+        self.chat_id = chat_id
+        self.agents = agents  # [(name, system_message)], B first as in round_robin_speaker
+        self.messages = [{"name": admin_name, "content": initial_message}]
+        self.max_round = max_round
+        self.speaker_idx = 0
+        self.tokens = 0  # Total tokens reported by the batch endpoint for this chat
+        self.retries = 0  # Failed attempts at the current turn
+        self.failed = False  # Gave up on a turn; the transcript is incomplete and must not be recorded
+
+    @property
+    def done(self):
+        # Same round accounting as autogen.GroupChat: initial message + (max_round - 1) replies
+        return self.failed or len(self.messages) >= self.max_round
+
+    def pending_request(self):
+        name, system_message = self.agents[self.speaker_idx]
+        return {
+            "custom_id": f"{self.chat_id}:{len(self.messages)}",
+            "speaker": name,
+            "system": system_message,
+            "contents": render_contents(name, self.messages),
+        }
+
+    def apply_reply(self, text, tokens=0):
+        name = self.agents[self.speaker_idx][0]
+        self.messages.append({"name": name, "content": text})
+        self.tokens += tokens
+        self.retries = 0
+        self.speaker_idx = (self.speaker_idx + 1) % len(self.agents)
+
+    def reply_failed(self, max_retries=MAX_ITEM_RETRIES):
+        """Count a failed turn; the same turn is resubmitted next step until retries run out"""
+        self.retries += 1
+        if self.retries > max_retries:
+            self.failed = True
+
+class LocalBatchClient:
+    """Local stand-in for a batch endpoint, answers every request without network calls"""
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.jobs = {}
+        self.submitted = 0
+
+    def submit(self, requests):
+        self.submitted += 1
+        job_id = f"local-batch-{self.submitted}"
+        replies = []
+        for r in requests:
+            text = f"Acknowledged turn {r['custom_id']} ({len(r['contents'])} prior blocks)."
+            prompt_chars = len(r["system"]) + sum(len(c["parts"][0]["text"]) for c in r["contents"])
+            replies.append((text, (prompt_chars + len(text)) // 4))  # Rough token estimate
+        self.jobs[job_id] = replies
+        return job_id
+
+    def wait(self, job_id):
+        """Return (reply_text, total_tokens) per request, in submission order (None for a failed request)"""
+        time.sleep(self.latency)
+        return self.jobs.pop(job_id)
+
+class GeminiBatchClient:
+    """Submits each lockstep step as Gemini Batch API jobs with inlined requests, split by payload size"""
+    def __init__(self, api_key, model="gemini-2.5-flash", temperature=0.7, poll_interval=BATCH_POLL_INTERVAL):
+        from google import genai
+        self.client = genai.Client(api_key=api_key)
+        self.model = model
+        self.temperature = temperature
+        self.poll_interval = poll_interval
+
+    def submit(self, requests):
+        """Create one job per chunk of at most INLINE_BATCH_BYTES and return their names, in order"""
+        chunks = []
+        chunk_bytes = 0
+        for r in requests:
+            inlined = {
+                "contents": r["contents"],
+                "config": {"system_instruction": r["system"], "temperature": self.temperature},
+            }
+            size = len(json.dumps(inlined).encode("utf-8"))
+            if size > INLINE_BATCH_BYTES:
+                raise ValueError(f"Request {r['custom_id']} is {size} bytes, over the inline batch limit")
+            if not chunks or chunk_bytes + size > INLINE_BATCH_BYTES:
+                chunks.append(([], r["custom_id"]))
+                chunk_bytes = 0
+            chunks[-1][0].append(inlined)
+            chunk_bytes += size
+
+        job_names = []
+        for inlined_requests, display_name in chunks:
+            job = self.client.batches.create(
+                model=f"models/{self.model}",
+                src=inlined_requests,
+                config={"display_name": display_name},
+            )
+            job_names.append(job.name)
+        return job_names
+
+    def wait(self, job_names):
+        """Return (reply_text, total_tokens) per request across all jobs of a step (None for a failed request)"""
+        replies = []
+        for job_name in job_names:
+            replies += self._wait_job(job_name)
+        return replies
+
+    def _wait_job(self, job_name):
+        while True:
+            job = self.client.batches.get(name=job_name)
+            if job.state.name in BATCH_DONE_STATES:
+                break
+            time.sleep(self.poll_interval)
+        if job.state.name != "JOB_STATE_SUCCEEDED":
+            raise RuntimeError(f"Batch job {job_name} ended in state {job.state.name}")
+
+        replies = []
+        for item in job.dest.inlined_responses:
+            if item.error or not item.response:
+                print(f"Batch item failed in {job_name}: {item.error}")
+                replies.append(None)
+            else:
+                usage = item.response.usage_metadata
+                replies.append((item.response.text or "", (usage.total_token_count or 0) if usage else 0))
+        return replies
+
+def run_lockstep(chats, client):
+    """Advance all chats together, one bulk submission per step, until every chat is done"""
+    step = 0
+    while True:
+        active = [chat for chat in chats if not chat.done]
+        if not active:
+            break
+        step += 1
+        requests = [chat.pending_request() for chat in active]
+        print(f"Batch step {step}: submitting {len(requests)} agent turns")
+        job_id = client.submit(requests)
+        replies = client.wait(job_id)
+        if len(replies) != len(requests):
+            raise RuntimeError(f"Batch job {job_id} returned {len(replies)} results for {len(requests)} requests")
+        for chat, reply in zip(active, replies):
+            if reply is None:
+                chat.reply_failed()
+                if chat.failed:
+                    print(f"Giving up on {chat.chat_id} after {chat.retries} failed attempts at turn {len(chat.messages)}")
+            else:
+                chat.apply_reply(*reply)
+    return step
+
+def print_transcript(chat):
+    """Print a finished chat in the same shape autogen prints group chat turns"""
+    for message in chat.messages:
+        print(f"{message['name']}:\n{message['content']}\n")
+        print("-" * 80)
@@ -0,0 +1,129 @@
+from array import array
+from collections import deque
+
+class ClassroomIndex:
+    """Maps classroom names like "C7" to dense integer ids and back"""
+    __slots__ = ("names", "ids")
+
+    def __init__(self, names):
+        self.names = list(names)
+        self.ids = {name: i for i, name in enumerate(self.names)}
+
+    def __len__(self):
+        return len(self.names)
+
+    def id_of(self, name):
+        return self.ids[name]
+
+class CampusState:
+    """Reward, violation, commitment and queue state keyed by integer classroom id.
+
+    Scores live in flat int arrays, commitments are bucketed by slot so a slot only
+    touches its own entries, and both queues support O(1) updates. The prompt text
+    for current commitments is cached until the commitments change.
+    """
+    __slots__ = (
+        "index", "rewards", "violations", "commitments", "commitment_count",
+        "committed_queue", "never_committed", "_never_committed_pos", "_history_cache",
+    )
+
+    def __init__(self, names):
+        self.index = ClassroomIndex(names)
+        self.reset()
+
+    def reset(self):
+        n = len(self.index)
+        self.rewards = array("i", [0]) * n  # Reward points per classroom id
+        self.violations = array("i", [0]) * n  # Violation counts per classroom id
+        self.commitments = {}  # slot_day -> {(debtor_id, creditor_id): minutes owed}
+        self.commitment_count = 0
+        self.committed_queue = deque()  # Classroom ids that have committed before, oldest first
+        self.never_committed = list(range(n))  # Classroom ids that have never committed
+        self._never_committed_pos = array("i", range(n))  # Position in never_committed, -1 once removed
+        self._history_cache = None
+
+    # Name-based view used by prompts and reports
+    def reward(self, name):
+        return self.rewards[self.index.id_of(name)]
+
+    def violation_count(self, name):
+        return self.violations[self.index.id_of(name)]
+
+    def add_reward(self, name, delta):
+        self.rewards[self.index.id_of(name)] += delta
+
+    def record_violation(self, name):
+        cid = self.index.id_of(name)
+        self.violations[cid] += 1
+        return self.violations[cid]
+
+    def add_commitment(self, debtor, creditor, slot_day, minutes):
+        bucket = self.commitments.setdefault(slot_day, {})
+        key = (self.index.id_of(debtor), self.index.id_of(creditor))
+        if key not in bucket:
+            self.commitment_count += 1
+        bucket[key] = bucket.get(key, 0) + minutes
+        self._history_cache = None
+
+    def commitments_for(self, slot_day):
+        """(debtor, creditor) names of commitments due at this slot, in insertion order"""
+        names = self.index.names
+        return [(names[d], names[c]) for d, c in self.commitments.get(slot_day, ())]
+
+    def names_with_commitments(self):
+        """Classrooms owing or owed minutes in any open commitment"""
+        names = self.index.names
+        return {names[cid] for bucket in self.commitments.values() for pair in bucket for cid in pair}
+
+    def clear_commitment(self, debtor, creditor, slot_day):
+        bucket = self.commitments[slot_day]
+        minutes = bucket.pop((self.index.id_of(debtor), self.index.id_of(creditor)))
+        if not bucket:
+            del self.commitments[slot_day]
+        self.commitment_count -= 1
+        self._history_cache = None
+        return minutes
+
+    def history_str(self):
+        if self._history_cache is None:
+            names = self.index.names
+            lines = ["\nCurrent commitments:\n"]
+            for slot_day, bucket in self.commitments.items():
+                for (debtor, creditor), mins in bucket.items():
+                    lines.append(f"{names[debtor]} owes {names[creditor]} {mins} minutes for {slot_day}.\n")
+            self._history_cache = "".join(lines)
+        return self._history_cache
+
+    def commit_random_never_committed(self, rng):
+        """Move a random never-committed classroom to the committed queue and return its name"""
+        cid = rng.choice(self.never_committed)
+        # Swap-remove keeps removal O(1)
+        pos = self._never_committed_pos[cid]
+        last = self.never_committed.pop()
+        if last != cid:
+            self.never_committed[pos] = last
+            self._never_committed_pos[last] = pos
+        self._never_committed_pos[cid] = -1
+        self.committed_queue.append(cid)
+        return self.index.names[cid]
+
+    def rotate_committed(self):
+        """Send the longest-waiting committed classroom to the back of the queue and return its name"""
+        cid = self.committed_queue.popleft()
+        self.committed_queue.append(cid)
+        return self.index.names[cid]
+
+    def snapshot(self):
+        """Name-keyed copy of the state, e.g. for replay results"""
+        names = self.index.names
+        return {
+            "commitments": {
+                (names[d], names[c], slot_day): mins
+                for slot_day, bucket in self.commitments.items()
+                for (d, c), mins in bucket.items()
+            },
+            "reward_scores": dict(zip(names, self.rewards)),
+            "violation_counts": dict(zip(names, self.violations)),
+            "committed_queue": [names[cid] for cid in self.committed_queue],
+            "never_committed_queue": [names[cid] for cid in self.never_committed],
+        }
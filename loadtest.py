@@ -0,0 +1,420 @@
+import argparse
+import asyncio
+import functools
+import gc
+import json
+import math
+import multiprocessing
+import os
+import re
+import threading
+import time
+import tracemalloc
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import autogen
+
+# system3 checks for a key at import; the load test only talks to the local stand-in server
+os.environ.setdefault("GEMINI_API_KEY", "unused-by-loadtest")
+import system3
+from rng_streams import RngStream
+
+# Load Test Settings
+MONITOR_INTERVAL = 0.05  # Seconds between saturation/memory samples
+STUB_OFFSETS = [-4, -2, 0, 2, 4]  # Exit offsets the stand-in model "negotiates"
+
+def parse_latency(spec):
+    """Latency distribution from 'fixed:S', 'uniform:LO:HI', 'exponential:MEAN' or 'lognormal:MEDIAN:SIGMA' (seconds)"""
+    kind, *params = spec.split(":")
+    params = [float(p) for p in params]
+    if kind == "fixed" and len(params) == 1:
+        return lambda rng: params[0]
+    if kind == "uniform" and len(params) == 2:
+        return lambda rng: rng.uniform(params[0], params[1])
+    if kind == "exponential" and len(params) == 1:
+        return lambda rng: rng.expovariate(1 / params[0]) if params[0] > 0 else 0.0
+    if kind == "lognormal" and len(params) == 2:
+        return lambda rng: params[0] * rng.lognormvariate(0, params[1])
+    raise ValueError(f"Unknown latency distribution {spec!r}")
+
+class StubModelServer:
+    """Local stand-in for an OpenAI-compatible chat completions endpoint with injected latency and errors"""
+    def __init__(self, latency="lognormal:0.3:0.5", error_rate=0.0, seed=42, port=0):
+        self.sample_latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.rng = RngStream(seed, ("stub_server",))
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/v1"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def reset_counters(self):
+        with self.lock:
+            self.requests = 0
+            self.errors = 0
+            self.peak_in_flight = 0
+
+    def stats(self):
+        with self.lock:
+            return {"requests": self.requests, "errors": self.errors, "peak_in_flight": self.peak_in_flight}
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _reply(self, messages):
+        system_prompt = next((m.get("content") or "" for m in messages if m.get("role") == "system"), "")
+        match = re.search(r"Classroom Agent (C\d+)", system_prompt)
+        with self.lock:
+            offset = self.rng.choice(STUB_OFFSETS)
+        if match:
+            return f"Professor consulted. Agreed to terms. {match.group(1)} shifting to {offset:+d} min."
+        return "BOTTLENECK STATUS: Traffic flow update, monitoring incoming students."
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/stats":
+                    self._send(200, server.stats())
+                else:
+                    self._send(404, {"error": {"message": "not found"}})
+
+            def do_POST(self):
+                if self.path == "/stats/reset":
+                    self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                    server.reset_counters()
+                    self._send(200, {})
+                    return
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                with server.lock:
+                    server.requests += 1
+                    server.in_flight += 1
+                    server.peak_in_flight = max(server.peak_in_flight, server.in_flight)
+                    delay = server.sample_latency(server.rng)
+                    fail = server.rng.random() < server.error_rate
+                try:
+                    time.sleep(delay)
+                    if fail:
+                        with server.lock:
+                            server.errors += 1
+                        self._send(500, {"error": {"message": "injected error", "type": "server_error"}})
+                        return
+                    messages = body.get("messages", [])
+                    content = server._reply(messages)
+                    prompt_tokens = sum(len(m.get("content") or "") for m in messages) // 4
+                    completion_tokens = len(content) // 4
+                    self._send(200, {
+                        "id": f"stub-{server.requests}",
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": body.get("model", "stub"),
+                        "choices": [{
+                            "index": 0,
+                            "message": {"role": "assistant", "content": content},
+                            "finish_reason": "stop",
+                        }],
+                        "usage": {
+                            "prompt_tokens": prompt_tokens,
+                            "completion_tokens": completion_tokens,
+                            "total_tokens": prompt_tokens + completion_tokens,
+                        },
+                    })
+                finally:
+                    with server.lock:
+                        server.in_flight -= 1
+
+            def _send(self, status, payload):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+def serve_stub(latency, error_rate, seed, conn):
+    """Child-process entry point: run a StubModelServer and send its port back over conn"""
+    server = StubModelServer(latency, error_rate, seed)
+    conn.send(server.httpd.server_address[1])
+    conn.close()
+    server.httpd.serve_forever()
+
+class StubServerProcess:
+    """StubModelServer in its own process, so its threads, CPU and memory stay out of the measurements.
+
+    Counters are read over the server's /stats endpoint.
+    """
+    def __init__(self, latency="lognormal:0.3:0.5", error_rate=0.0, seed=42):
+        self.args = (latency, error_rate, seed)
+        self.process = None
+        self.port = None
+        self.opener = urllib.request.build_opener(urllib.request.ProxyHandler({}))  # Never route localhost via a proxy
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    def start(self):
+        ctx = multiprocessing.get_context("spawn")
+        parent_conn, child_conn = ctx.Pipe(duplex=False)
+        self.process = ctx.Process(target=serve_stub, args=(*self.args, child_conn), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.port = parent_conn.recv()
+        parent_conn.close()
+        return self
+
+    def _call(self, path, data=None):
+        with self.opener.open(f"http://127.0.0.1:{self.port}{path}", data=data, timeout=10) as response:
+            return json.loads(response.read())
+
+    def stats(self):
+        return self._call("/stats")
+
+    def reset_counters(self):
+        self._call("/stats/reset", data=b"")
+
+    def stop(self):
+        self.process.terminate()
+        self.process.join()
+
+class LoadMonitor:
+    """Samples in-flight chats, threads, event-loop lag and traced memory while the load runs"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.peak_threads = 0
+        self.peak_loop_lag = 0.0
+        self.memory_samples = []  # (in_flight, traced_bytes)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def chat_started(self):
+        with self.lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def chat_finished(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(MONITOR_INTERVAL):
+            self.peak_threads = max(self.peak_threads, threading.active_count())
+            self.memory_samples.append((self.in_flight, tracemalloc.get_traced_memory()[0]))
+
+    async def watch_loop(self):
+        """Measure how late the event loop wakes up; large lag means the loop is saturated"""
+        loop = asyncio.get_running_loop()
+        while not self._stop.is_set():
+            start = loop.time()
+            await asyncio.sleep(MONITOR_INTERVAL)
+            self.peak_loop_lag = max(self.peak_loop_lag, loop.time() - start - MONITOR_INTERVAL)
+
+def build_slot_chat(index, llm_config, max_round, seed):
+    """One system3-style slot negotiation: agent B plus the slot's classroom agents"""
+    slots = [(day, slot, rooms) for day, schedule in system3.TIMETABLE.items() for slot, rooms in schedule.items()]
+    day, time_slot, active_classrooms = slots[index % len(slots)]
+    slot_rng = RngStream(seed).child("chat", index)
+    total_students = sum(system3.CLASSROOM_ATTENDANCE[c] for c in active_classrooms)
+
+    agent_b = autogen.AssistantAgent(
+        name="B",
+        system_message=system3.get_agent_b_system_message(active_classrooms, total_students),
+        llm_config=llm_config,
+    )
+    classroom_agents = [
+        autogen.AssistantAgent(
+            name=classroom,
+            system_message=system3.get_classroom_agent_system_message(
+                classroom, active_classrooms, day, time_slot, slot_rng.child("agent", classroom)
+            ),
+            llm_config=llm_config,
+        )
+        for classroom in active_classrooms
+    ]
+    groupchat = autogen.GroupChat(
+        agents=[agent_b] + classroom_agents,
+        messages=[],
+        max_round=max_round,
+        speaker_selection_method=functools.partial(system3.custom_speaker_selection, rng=slot_rng.child("speaker_selection")),
+    )
+    manager = autogen.GroupChatManager(groupchat=groupchat, llm_config=llm_config, silent=True)
+    admin = autogen.UserProxyAgent(name="Admin", human_input_mode="NEVER", code_execution_config=False)
+    message = f"Start Bottleneck Coordination Simulation\n\nScenario: {day} {time_slot}\nBegin Coordination - Agent B start with bottleneck status report"
+    return admin, manager, message
+
+def run_threads(args, llm_config, monitor):
+    def one_chat(index):
+        admin, manager, message = build_slot_chat(index, llm_config, args.max_round, args.seed)
+        monitor.chat_started()
+        start = time.perf_counter()
+        try:
+            admin.initiate_chat(manager, message=message, silent=True)
+            return time.perf_counter() - start, None
+        except Exception as e:
+            return time.perf_counter() - start, e
+        finally:
+            monitor.chat_finished()
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        return list(pool.map(one_chat, range(args.chats)))
+
+async def run_asyncio(args, llm_config, monitor):
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one_chat(index):
+        async with semaphore:
+            admin, manager, message = build_slot_chat(index, llm_config, args.max_round, args.seed)
+            monitor.chat_started()
+            start = time.perf_counter()
+            try:
+                await admin.a_initiate_chat(manager, message=message, silent=True)
+                return time.perf_counter() - start, None
+            except Exception as e:
+                return time.perf_counter() - start, e
+            finally:
+                monitor.chat_finished()
+
+    watcher = asyncio.create_task(monitor.watch_loop())
+    results = await asyncio.gather(*(one_chat(i) for i in range(args.chats)))
+    monitor._stop.set()
+    await watcher
+    return results
+
+def percentile(values, p):
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))]
+
+def memory_slope(samples):
+    """Least-squares bytes per in-flight chat over (in_flight, traced_bytes) samples; None without spread"""
+    if len(samples) < 2:
+        return None
+    mean_x = sum(x for x, _ in samples) / len(samples)
+    mean_y = sum(y for _, y in samples) / len(samples)
+    spread = sum((x - mean_x) ** 2 for x, _ in samples)
+    if not spread:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in samples) / spread
+
+def print_report(args, results, wall, cpu, server_stats, monitor, baseline_bytes):
+    durations = [d for d, error in results if error is None]
+    failures = [error for _, error in results if error is not None]
+    slope = memory_slope(monitor.memory_samples)
+    at_peak = [
+        (traced - baseline_bytes) / in_flight
+        for in_flight, traced in monitor.memory_samples if in_flight == monitor.peak_in_flight and in_flight > 0
+    ]
+
+    print("\n" + "="*70)
+    print("Load Test Report")
+    print("="*70)
+    print(f"\nMode: {args.mode}, concurrency {args.concurrency}, {args.chats} slot chats, max_round {args.max_round}")
+    print(f"Stand-in server: latency {args.latency}, error rate {args.error_rate:.1%}, retries {args.max_retries}")
+    print(f"\nThroughput:")
+    print(f"  Completed slots: {len(durations)}/{len(results)} ({len(failures)} failed)")
+    print(f"  Wall time: {wall:.2f}s")
+    print(f"  Slots per second: {len(durations) / wall if wall else 0:.2f}")
+    print(f"  LLM requests: {server_stats['requests']} ({server_stats['errors']} injected errors), {server_stats['requests'] / wall if wall else 0:.1f}/s")
+    print(f"\nSlot completion time:")
+    print(f"  p50: {percentile(durations, 50):.2f}s")
+    print(f"  p99: {percentile(durations, 99):.2f}s")
+    print(f"  max: {max(durations, default=0.0):.2f}s")
+    print(f"\nSaturation:")
+    print(f"  Peak in-flight chats: {monitor.peak_in_flight}")
+    print(f"  Peak concurrent model requests: {server_stats['peak_in_flight']}")
+    print(f"  Peak Python threads: {monitor.peak_threads}")
+    print(f"  Process CPU utilisation: {cpu / wall * 100 if wall else 0:.0f}% of one core")
+    if args.mode == "asyncio":
+        print(f"  Default executor size: {min(32, (os.cpu_count() or 1) + 4)} threads (sync LLM calls run there)")
+        print(f"  Peak event-loop lag: {monitor.peak_loop_lag * 1000:.1f}ms")
+    print(f"\nMemory:")
+    print(f"  Peak traced memory: {max((t for _, t in monitor.memory_samples), default=baseline_bytes) / 1e6:.1f} MB")
+    print(f"  Per in-flight chat: {'n/a' if slope is None else f'{slope / 1e3:.0f} KB'} slope vs. in-flight count, "
+          f"{percentile(at_peak, 50) / 1e3:.0f} KB above warm baseline at peak in-flight")
+    if failures:
+        print(f"\nFirst failure: {failures[0]!r}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive concurrent system3-style slot negotiations against a local stand-in model server")
+    parser.add_argument("--chats", type=int, default=100, help="Total slot negotiations to run")
+    parser.add_argument("--concurrency", type=int, default=20, help="Slot negotiations in flight at once")
+    parser.add_argument("--mode", choices=["threads", "asyncio"], default="threads")
+    parser.add_argument("--latency", default="lognormal:0.3:0.5", help="fixed:S, uniform:LO:HI, exponential:MEAN or lognormal:MEDIAN:SIGMA")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of model requests answered with HTTP 500")
+    parser.add_argument("--max-retries", type=int, default=2, help="Client retries per model request")
+    parser.add_argument("--max-round", type=int, default=15)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    server = StubServerProcess(args.latency, args.error_rate, args.seed).start()
+    llm_config = {
+        "cache_seed": None,  # Every turn must reach the server
+        "temperature": 0.7,
+        "config_list": [{
+            "model": "stub-model",
+            "base_url": server.base_url,
+            "api_key": "stub",
+            "api_type": "openai",
+            "max_retries": args.max_retries,
+            "price": [0, 0],
+        }],
+        "timeout": 120,
+    }
+
+    tracemalloc.start()
+    # Warm-up chat so lazy imports and client setup are not charged to in-flight chats
+    admin, manager, message = build_slot_chat(0, llm_config, args.max_round, args.seed)
+    admin.initiate_chat(manager, message=message, silent=True)
+    del admin, manager
+    gc.collect()
+    baseline_bytes = tracemalloc.get_traced_memory()[0]
+    server.reset_counters()
+    monitor = LoadMonitor()
+    monitor.start()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        if args.mode == "threads":
+            results = run_threads(args, llm_config, monitor)
+        else:
+            results = asyncio.run(run_asyncio(args, llm_config, monitor))
+    finally:
+        wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+        monitor.stop()
+        server_stats = server.stats()
+        server.stop()
+    print_report(args, results, wall, cpu, server_stats, monitor, baseline_bytes)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import copy
+import functools
+import re
+import time
+from collections import defaultdict
+
+import autogen
+
+# Routing Settings
+LITE_MODEL = "gemini-2.5-flash-lite"
+LITE_TIMEOUT = 30  # Seconds; lite turns are short
+TIERS = ("rule", "lite", "full")
+PROPOSAL_PATTERN = re.compile(r"\bpropos(?:e|al|ing)|\bcounter-propos|\bin return\b|\b(?:can|could|would|will) you\b|\?", re.IGNORECASE)
+
+def tier_llm_config(llm_config, model, timeout):
+    """Copy of an llm_config with every config_list entry switched to another model"""
+    config = copy.deepcopy(llm_config)
+    for entry in config["config_list"]:
+        entry["model"] = model
+    config["timeout"] = timeout
+    return config
+
+def client_tokens(client):
+    """Total tokens (including cache hits) billed so far to an OpenAIWrapper"""
+    summary = client.total_usage_summary or {}
+    return sum(usage.get("total_tokens", 0) for usage in summary.values() if isinstance(usage, dict))
+
+class SlotContext:
+    """What the router needs to know about the slot being negotiated"""
+    def __init__(self, label, total_students, capacity, attendance, pending, status):
+        self.label = label
+        self.total_students = total_students
+        self.capacity = capacity
+        self.attendance = attendance  # classroom -> students
+        self.pending = pending  # classrooms owing or owed minutes in any open commitment
+        self.status = status  # Agent B's templated status, in the script's own units
+        self.llm_calls = 0  # Model requests made for this slot (lite and full turns)
+        self.lite_tokens = 0  # Tokens billed to the router's lite client for this slot
+        self.rule_replies = set()  # Templated texts sent, so they are never read as proposals
+
+    @property
+    def contested(self):
+        return self.total_students > self.capacity
+
+class ModelRouter:
+    """Routes each agent turn to a rule-based responder, a lite model or the full model.
+
+    - Contested slots (total above capacity) and agents with pending commitments: full model.
+    - Agent B only observes and informs: templated status when uncontested, lite model otherwise.
+    - Classroom agents in uncontested slots: lite model to answer a proposal or question,
+      templated on-time acknowledgement otherwise.
+
+    Lite-tier tokens are billed to the router's own client, not the agents' usage
+    summaries; they are counted per slot in SlotContext.lite_tokens instead.
+    """
+    def __init__(self, llm_config, lite_model=LITE_MODEL, lite_timeout=LITE_TIMEOUT):
+        self.lite_llm_config = tier_llm_config(llm_config, lite_model, lite_timeout)
+        self.lite_client = autogen.OpenAIWrapper(**self.lite_llm_config)
+        self.decisions = []  # (slot label, agent, tier, reason, seconds)
+
+    def classify(self, agent_name, messages, context):
+        last = next(
+            (
+                m.get("content") or "" for m in reversed(messages)
+                if m.get("role") != "assistant" and m.get("name") != agent_name
+                and (m.get("content") or "") not in context.rule_replies
+            ),
+            "",
+        )
+        if agent_name == "B":
+            if context.contested:
+                return "lite", "status update in contested slot"
+            return "rule", "status update in uncontested slot"
+        if context.contested:
+            return "full", "contested slot"
+        if agent_name in context.pending:
+            return "full", "pending commitments"
+        if PROPOSAL_PATTERN.search(last):
+            return "lite", "simple accept/decline"
+        return "rule", "acknowledgement"
+
+    def rule_reply(self, agent_name, context):
+        if agent_name == "B":
+            return context.status
+        # No shift announced: parse_outcome keeps a room's last shift, which must stay the negotiated one
+        return f"{agent_name}: {context.attendance[agent_name]} students. Noted, nothing further from {agent_name} this round."
+
+    def attach(self, agents, context):
+        """Register the routing reply function ahead of the default LLM reply on each agent"""
+        # Bound rather than passed as config: register_reply copies config per agent, which would split the slot counters
+        route_reply = functools.partial(self._route_reply, context=context)
+        for agent in agents:
+            agent.register_reply([autogen.Agent, None], route_reply, position=0)
+
+    def _route_reply(self, recipient, messages=None, sender=None, config=None, context=None):
+        history = messages if messages is not None else recipient.chat_messages.get(sender, [])
+        tier, reason = self.classify(recipient.name, history, context)
+        start = time.perf_counter()
+        if tier == "rule":
+            reply = self.rule_reply(recipient.name, context)
+            context.rule_replies.add(reply)
+        elif tier == "lite":
+            tokens_before = client_tokens(self.lite_client)
+            _, reply = recipient.generate_oai_reply(messages, sender, config=self.lite_client)
+            context.lite_tokens += client_tokens(self.lite_client) - tokens_before
+            context.llm_calls += 1
+        else:
+            _, reply = recipient.generate_oai_reply(messages, sender)
+            context.llm_calls += 1
+        self.decisions.append((context.label, recipient.name, tier, reason, time.perf_counter() - start))
+        if reply is None:
+            print(f"No reply from the {tier} tier for {recipient.name} in {context.label}")
+        # Always final: falling through would resend the turn to the agent's full model, unrouted and uncounted
+        return True, reply
+
+    def print_report(self):
+        if not self.decisions:
+            return
+        seconds = defaultdict(list)
+        reasons = defaultdict(int)
+        for _, _, tier, reason, elapsed in self.decisions:
+            seconds[tier].append(elapsed)
+            reasons[(tier, reason)] += 1
+
+        print("\n" + "="*70)
+        print("Model Routing Report")
+        print("="*70)
+        for tier in TIERS:
+            if seconds[tier]:
+                mean = sum(seconds[tier]) / len(seconds[tier])
+                print(f"{tier}: {len(seconds[tier])} turns, mean {mean:.2f}s")
+        for (tier, reason), count in sorted(reasons.items()):
+            print(f"  {tier:<5} {reason}: {count}")
+        if seconds["full"]:
+            full_mean = sum(seconds["full"]) / len(seconds["full"])
+            saved = sum(full_mean - elapsed for tier in ("rule", "lite") for elapsed in seconds[tier])
+            print(f"Estimated latency saved vs. full model on every turn: {saved:.1f}s")
+        else:
+            print("No full-model turns to estimate savings against")
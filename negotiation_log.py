@@ -0,0 +1,154 @@
+import json
+import re
+import sqlite3
+import time
+import uuid
+import zlib
+
+# Patterns for outcomes stated in agent messages
+# A room's announcement, allowing markdown around the name ("**C2** shifting ...")
+SHIFT_PATTERN = re.compile(r"[*_`]*\b(C\d+)\b[*_`]*\s+(?:shifts|shifting|creating batch(?:es)?)\b", re.IGNORECASE)
+OFFSET_PATTERN = re.compile(r"\b(?:to|at)\s+([+-]?\d+)\s*min(?:ute)?s?\b(?:\s+(early|late)\b)?", re.IGNORECASE)
+STUDENTS_PATTERN = re.compile(r"\b(\d+)\s+students\b", re.IGNORECASE)
+SENTENCE_END_PATTERN = re.compile(r"(?<![.\d])[.!?](?![.\d])")  # Not an ellipsis or a decimal point
+AGREEMENT_PATTERN = re.compile(r"\bagreed to\b", re.IGNORECASE)
+COUNTER_PATTERN = re.compile(r"\bcounter-propos", re.IGNORECASE)
+CONGESTION_PATTERN = re.compile(r"CONGESTION ALERT|catastrophic failure", re.IGNORECASE)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS slots (
+    run TEXT NOT NULL,
+    seed INTEGER,
+    seq INTEGER NOT NULL,
+    week INTEGER NOT NULL,
+    day TEXT NOT NULL,
+    slot TEXT NOT NULL,
+    active TEXT NOT NULL,
+    transcript BLOB NOT NULL,
+    outcome TEXT NOT NULL,
+    PRIMARY KEY (run, week, day, slot)
+);
+CREATE INDEX IF NOT EXISTS slots_by_seq ON slots (run, seq);
+"""
+
+def new_run_id(seed=None):
+    """Run id unique per invocation, so concurrent or repeated runs never share archive keys"""
+    run_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    return run_id if seed is None else f"{run_id}-seed{seed}"
+
+def parse_batches(clause):
+    """[offset, students] for each exit batch in one room's announcement; students is None when unstated.
+
+    "early"/"late" after the offset give its sign. Students stated after an offset belong to
+    it, otherwise the count before it ("C3 shifts 90 students to 2 minutes early").
+    """
+    offsets = list(OFFSET_PATTERN.finditer(clause))
+    batches = []
+    for i, match in enumerate(offsets):
+        minutes = int(match.group(1))
+        if match.group(2):
+            minutes = -abs(minutes) if match.group(2).lower() == "early" else abs(minutes)
+        after = clause[match.end():offsets[i + 1].start() if i + 1 < len(offsets) else len(clause)]
+        before = clause[offsets[i - 1].end() if i else 0:match.start()]
+        students = STUDENTS_PATTERN.search(after) or STUDENTS_PATTERN.search(before)
+        batches.append([minutes, int(students.group(1)) if students else None])
+    return batches
+
+def parse_outcome(messages, active_classrooms):
+    """Extract the negotiated outcome from a slot transcript.
+
+    batches maps each room to its announced [offset, students] exit batches; a room's latest
+    message replaces its earlier ones. shifts keeps each room's last announced offset.
+    """
+    batches = {}
+    agreements = 0
+    counter_proposals = 0
+    congestion_alert = False
+    for message in messages:
+        content = message.get("content") or ""
+        announced = {}
+        for line in content.splitlines():
+            starts = list(SHIFT_PATTERN.finditer(line))
+            for i, match in enumerate(starts):
+                classroom = match.group(1).upper()
+                if classroom not in active_classrooms:
+                    continue
+                clause = line[match.end():starts[i + 1].start() if i + 1 < len(starts) else len(line)]
+                clause = SENTENCE_END_PATTERN.split(clause, 1)[0]
+                announced.setdefault(classroom, []).extend(parse_batches(clause))
+        for classroom, room_batches in announced.items():
+            if room_batches:
+                batches[classroom] = room_batches  # Last broadcast wins
+        agreements += len(AGREEMENT_PATTERN.findall(content))
+        counter_proposals += len(COUNTER_PATTERN.findall(content))
+        congestion_alert = congestion_alert or bool(CONGESTION_PATTERN.search(content))
+    return {
+        "shifts": {classroom: room_batches[-1][0] for classroom, room_batches in batches.items()},
+        "batches": batches,
+        "agreements": agreements,
+        "counter_proposals": counter_proposals,
+        "congestion_alert": congestion_alert,
+        "turns": len(messages),
+    }
+
+class NegotiationRecorder:
+    """Stores each slot's transcript (zlib-compressed) and parsed outcome in an indexed SQLite archive"""
+    def __init__(self, path, run_id=None, seed=None):
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+        self.run_id = run_id or new_run_id(seed)
+        self.seed = seed  # Run seed, so replays can re-derive the same random streams
+        self.seq = 0
+
+    def record(self, week, day, slot, active_classrooms, messages, run_id=None, seed=None):
+        transcript = [{"name": m.get("name"), "content": m.get("content") or ""} for m in messages]
+        outcome = parse_outcome(transcript, active_classrooms)
+        self.seq += 1
+        self.conn.execute(
+            "INSERT INTO slots VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                run_id or self.run_id, self.seed if seed is None else seed, self.seq, week, day, slot,
+                json.dumps(active_classrooms),
+                zlib.compress(json.dumps(transcript).encode("utf-8")),
+                json.dumps(outcome),
+            ),
+        )
+        self.conn.commit()
+        return outcome
+
+    def close(self):
+        self.conn.close()
+
+def load_runs(path):
+    conn = sqlite3.connect(path)
+    try:
+        return [row[0] for row in conn.execute("SELECT DISTINCT run FROM slots ORDER BY run")]
+    finally:
+        conn.close()
+
+def load_slots(path, run_id=None, with_transcripts=False):
+    """Return recorded slots in simulation order; transcripts are only decompressed on request"""
+    conn = sqlite3.connect(path)
+    try:
+        query = "SELECT run, seed, week, day, slot, active, outcome, transcript FROM slots"
+        params = ()
+        if run_id is not None:
+            query += " WHERE run = ?"
+            params = (run_id,)
+        records = []
+        for run, seed, week, day, slot, active, outcome, transcript in conn.execute(query + " ORDER BY run, seq", params):
+            record = {
+                "run": run,
+                "seed": seed,
+                "week": week,
+                "day": day,
+                "slot": slot,
+                "active_classrooms": json.loads(active),
+                "outcome": json.loads(outcome),
+            }
+            if with_transcripts:
+                record["transcript"] = json.loads(zlib.decompress(transcript).decode("utf-8"))
+            records.append(record)
+        return records
+    finally:
+        conn.close()
@@ -0,0 +1,161 @@
+import cProfile
+import functools
+import os
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+# Profiling Settings
+PROFILE_MODES = (None, "timers", "cprofile", "sampling")
+SAMPLE_INTERVAL = 0.005  # Seconds between stack samples in sampling mode
+
+class SlotProfiler:
+    """Opt-in phase timers per simulation slot, with optional cProfile dumps or stack sampling.
+
+    Phase times are exclusive: time spent in a nested phase (e.g. llm_call inside
+    group_chat) is only counted for the inner phase, so the group_chat remainder is
+    the framework's own message handling. Slots are assumed to run one at a time.
+    """
+    def __init__(self, mode=None, output_dir="profiles", sample_interval=SAMPLE_INTERVAL):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode {mode!r}, expected one of {PROFILE_MODES}")
+        self.mode = mode
+        self.output_dir = output_dir
+        self.sample_interval = sample_interval
+        self.slots = []  # [(label, wall_seconds, {phase: exclusive_seconds})]
+        self.stacks = defaultdict(int)  # Collapsed stack -> sample count
+        self._slot = None
+        self._stack = []  # [[phase, child_seconds]] of currently open phases
+        self._cprofile = None
+        self._sampler = None
+        self._stop_sampling = None
+        self._patched = {}  # Client class -> original create, while instrumented
+
+    @property
+    def enabled(self):
+        return self.mode is not None
+
+    def begin_slot(self, label):
+        if not self.enabled:
+            return
+        self._slot = {"label": label, "start": time.perf_counter(), "phases": defaultdict(float)}
+        if self.mode == "cprofile":
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        elif self.mode == "sampling":
+            self._stop_sampling = threading.Event()
+            self._sampler = threading.Thread(
+                target=self._sample,
+                args=(threading.get_ident(), label, self._stop_sampling),
+                daemon=True,
+            )
+            self._sampler.start()
+
+    def end_slot(self):
+        if not self.enabled or self._slot is None:
+            return
+        wall = time.perf_counter() - self._slot["start"]
+        label = self._slot["label"]
+        if self._cprofile:
+            self._cprofile.disable()
+            os.makedirs(self.output_dir, exist_ok=True)
+            self._cprofile.dump_stats(os.path.join(self.output_dir, f"{self._file_label(label)}.prof"))
+            self._cprofile = None
+        if self._sampler:
+            self._stop_sampling.set()
+            self._sampler.join()
+            self._sampler = None
+        self.slots.append((label, wall, dict(self._slot["phases"])))
+        self._slot = None
+
+    @contextmanager
+    def _timed(self, name):
+        start = time.perf_counter()
+        self._stack.append([name, 0.0])
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            _, child_seconds = self._stack.pop()
+            self._slot["phases"][name] += elapsed - child_seconds
+            if self._stack:
+                self._stack[-1][1] += elapsed
+
+    def phase(self, name):
+        if not self.enabled or self._slot is None:
+            return nullcontext()
+        return self._timed(name)
+
+    def wrap(self, name, func):
+        """Return func timed under the given phase (func itself when profiling is off)"""
+        if not self.enabled:
+            return func
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            with self.phase(name):
+                return func(*args, **kwargs)
+        return timed
+
+    def instrument_llm_calls(self, client_cls):
+        """Time every request made through an autogen client class (e.g. autogen.OpenAIWrapper).
+
+        Patches the class once; calling again is a no-op until restore_llm_calls.
+        """
+        if self.enabled and client_cls not in self._patched:
+            self._patched[client_cls] = client_cls.create
+            client_cls.create = self.wrap("llm_call", client_cls.create)
+
+    def restore_llm_calls(self):
+        """Undo instrument_llm_calls on every patched client class"""
+        for client_cls, create in self._patched.items():
+            client_cls.create = create
+        self._patched.clear()
+
+    def _sample(self, thread_id, label, stop):
+        while not stop.wait(self.sample_interval):
+            frame = sys._current_frames().get(thread_id)
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[";".join([label] + frames[::-1])] += 1
+
+    def _file_label(self, label):
+        return re.sub(r"[^A-Za-z0-9_-]+", "_", label).strip("_")
+
+    def write_collapsed(self, path):
+        """Write sampled stacks in collapsed format (one 'frame;frame;... count' per line) for flamegraph tools"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f"{stack} {count}\n")
+
+    def print_report(self):
+        if not self.slots:
+            return
+        phases = sorted({name for _, _, slot_phases in self.slots for name in slot_phases})
+        totals = defaultdict(float)
+        total_wall = 0.0
+
+        print("\n" + "="*70)
+        print("Profile Report (exclusive seconds per phase)")
+        print("="*70)
+        for label, wall, slot_phases in self.slots:
+            total_wall += wall
+            unattributed = wall - sum(slot_phases.values())
+            totals["unattributed"] += unattributed
+            print(f"\n{label}: {wall:.3f}s wall")
+            for name in phases:
+                seconds = slot_phases.get(name, 0.0)
+                totals[name] += seconds
+                print(f"  {name:<20} {seconds:8.3f}s  {seconds / wall * 100 if wall else 0:5.1f}%")
+            print(f"  {'unattributed':<20} {unattributed:8.3f}s")
+
+        print(f"\nAll slots: {total_wall:.3f}s wall")
+        for name in phases + ["unattributed"]:
+            print(f"  {name:<20} {totals[name]:8.3f}s  {totals[name] / total_wall * 100 if total_wall else 0:5.1f}%")
@@ -0,0 +1,208 @@
+import json
+import mmap
+import os
+from array import array
+
+# Column name -> array typecode; "categorical" columns hold int32 codes into a string dictionary
+COLUMNS = {
+    "run": "i",
+    "week": "i",
+    "day": "i",
+    "slot": "i",
+    "active_rooms": "i",
+    "total_students": "i",
+    "plan_offsets": "i",
+    "peak_flow": "i",
+    "commitments_made": "i",
+    "commitments_fulfilled": "i",
+    "violations": "i",
+    "llm_calls": "i",
+    "tokens": "q",
+}
+CATEGORICAL = ("run", "day", "slot", "active_rooms", "plan_offsets")
+FLUSH_ROWS = 1024  # Rows buffered in memory before a batch append to the column files
+
+def outcome_batches(outcome):
+    """room -> [[offset, students], ...] from a parsed outcome; older outcomes only carry shifts"""
+    if "batches" in outcome:
+        return outcome["batches"]
+    return {room: [[offset, None]] for room, offset in outcome["shifts"].items()}
+
+def format_offsets(batches):
+    """Canonical text for a room -> exit batches plan, e.g. "C1:-2x60/+0x60,C2:+2\""""
+    return ",".join(
+        f"{room}:" + "/".join(f"{offset:+d}" if students is None else f"{offset:+d}x{students}" for offset, students in room_batches)
+        for room, room_batches in sorted(batches.items())
+    )
+
+def room_release(students, room_batches):
+    """Students per exit offset for one room. Batches without a stated count share what is left;
+    a room with no announced batch leaves on time."""
+    if not room_batches:
+        return {0: students}
+    stated = sum(count for _, count in room_batches if count is not None)
+    unstated = [offset for offset, count in room_batches if count is None]
+    released = {}
+    for offset, count in room_batches:
+        if count is None:
+            count = max(students - stated, 0) / len(unstated)
+        released[offset] = released.get(offset, 0) + count
+    return released
+
+def peak_flow(attendance, batches):
+    """Most students released at the same exit offset across all rooms' batches"""
+    by_offset = {}
+    for room, students in attendance.items():
+        for offset, count in room_release(students, batches.get(room)).items():
+            by_offset[offset] = by_offset.get(offset, 0) + count
+    return round(max(by_offset.values(), default=0))
+
+def slot_record(run, week, day, slot, attendance, outcome, counts, llm_calls, tokens):
+    """Build one results row; attendance maps each active room to its students, counts come from the post-chat policy"""
+    counts = counts or {}
+    batches = outcome_batches(outcome)
+    return {
+        "run": run,
+        "week": week,
+        "day": day,
+        "slot": slot,
+        "active_rooms": ",".join(attendance),
+        "total_students": sum(attendance.values()),
+        "plan_offsets": format_offsets(batches),
+        "peak_flow": peak_flow(attendance, batches),
+        "commitments_made": counts.get("commitments_made", 0),
+        "commitments_fulfilled": counts.get("commitments_fulfilled", 0),
+        "violations": counts.get("violations", 0),
+        "llm_calls": llm_calls,
+        "tokens": tokens,
+    }
+
+def usage_tokens(agents):
+    """Total tokens used by these agents' LLM clients (including cache hits)"""
+    import autogen
+    usage = autogen.gather_usage_summary(agents)["usage_including_cached_inference"]
+    return sum(model_usage.get("total_tokens", 0) for model_usage in usage.values() if isinstance(model_usage, dict))
+
+class ResultsWriter:
+    """Appends per-slot records to a columnar store: one binary file per column plus a string dictionary.
+
+    Rows are buffered and appended in batches; assumes a single writer per store.
+    """
+    def __init__(self, path, flush_rows=FLUSH_ROWS):
+        self.path = path
+        self.flush_rows = flush_rows
+        os.makedirs(path, exist_ok=True)
+        self.dictionary = _load_dictionary(path)
+        self.codes = {name: {value: i for i, value in enumerate(values)} for name, values in self.dictionary.items()}
+        self.buffers = {name: array(typecode) for name, typecode in COLUMNS.items()}
+        self.buffered_rows = 0
+
+    def append(self, record):
+        for name in COLUMNS:
+            value = record.get(name, 0)
+            if name in CATEGORICAL:
+                value = self._encode(name, str(value))
+            self.buffers[name].append(value)
+        self.buffered_rows += 1
+        if self.buffered_rows >= self.flush_rows:
+            self.flush()
+
+    def _encode(self, name, value):
+        codes = self.codes[name]
+        if value not in codes:
+            codes[value] = len(self.dictionary[name])
+            self.dictionary[name].append(value)
+        return codes[value]
+
+    def flush(self):
+        if not self.buffered_rows:
+            return
+        # Dictionary first, replaced atomically, so every code on disk can be decoded
+        tmp_path = os.path.join(self.path, "dictionary.json.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.dictionary, f)
+        os.replace(tmp_path, os.path.join(self.path, "dictionary.json"))
+        for name, buffer in self.buffers.items():
+            with open(os.path.join(self.path, f"{name}.col"), "ab") as f:
+                buffer.tofile(f)
+            del buffer[:]
+        self.buffered_rows = 0
+
+    def close(self):
+        self.flush()
+
+class ResultsReader:
+    """Memory-mapped read access to a results store; columns come back as typed memoryviews"""
+    def __init__(self, path):
+        self.path = path
+        self.dictionary = _load_dictionary(path)
+        self._maps = {}
+        self._columns = {}
+        for name, typecode in COLUMNS.items():
+            column_path = os.path.join(path, f"{name}.col")
+            if not os.path.exists(column_path) or os.path.getsize(column_path) == 0:
+                self._columns[name] = memoryview(array(typecode))
+                continue
+            with open(column_path, "rb") as f:
+                self._maps[name] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._columns[name] = memoryview(self._maps[name]).cast(typecode)
+        self.num_rows = min(len(column) for column in self._columns.values())
+
+    def __len__(self):
+        return self.num_rows
+
+    def column(self, name):
+        """Raw column (dictionary codes for categorical columns), truncated to complete rows.
+
+        The view stays valid after close(); its mapping is unmapped once the last view is dropped.
+        """
+        return self._columns[name][:self.num_rows]
+
+    def decode(self, name, code):
+        return self.dictionary[name][code]
+
+    def rows(self):
+        for i in range(self.num_rows):
+            yield {
+                name: self.decode(name, column[i]) if name in CATEGORICAL else column[i]
+                for name, column in self._columns.items()
+            }
+
+    def close(self):
+        for column in self._columns.values():
+            column.release()
+        for mapped in self._maps.values():
+            try:
+                mapped.close()
+            except BufferError:
+                pass  # Caller still holds a column view; the map closes when it is garbage collected
+        self._maps.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _load_dictionary(path):
+    dictionary = {name: [] for name in CATEGORICAL}
+    dictionary_path = os.path.join(path, "dictionary.json")
+    if os.path.exists(dictionary_path):
+        with open(dictionary_path) as f:
+            dictionary.update(json.load(f))
+    return dictionary
+
+def summarize(path):
+    """Print store-wide totals; each column is scanned once straight from the memory map"""
+    with ResultsReader(path) as reader:
+        rows = len(reader)
+        print(f"Rows: {rows} slots across {len(set(reader.column('run')))} runs")
+        if not rows:
+            return
+        print(f"Mean peak flow: {sum(reader.column('peak_flow')) / rows:.1f} students")
+        for name in ("commitments_made", "commitments_fulfilled", "violations", "llm_calls", "tokens"):
+            print(f"Total {name.replace('_', ' ')}: {sum(reader.column(name))}")
+
+if __name__ == "__main__":
+    import sys
+    summarize(sys.argv[1])
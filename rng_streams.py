@@ -0,0 +1,42 @@
+import hashlib
+import random
+
+def derive_seed(seed, path):
+    """Stable 64-bit seed for a node of the hierarchy; independent of process, thread and call order"""
+    digest = hashlib.sha256(repr((seed, tuple(path))).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big")
+
+class RngStream(random.Random):
+    """Seeded random stream at one node of the run -> week -> day/slot -> agent hierarchy.
+
+    Each node's sequence depends only on the run seed and its path, so slots and
+    agents draw the same numbers whether they run sequentially, concurrently or in
+    other processes.
+    """
+    def __init__(self, seed, path=()):
+        self.root_seed = seed
+        self.path = tuple(path)
+        super().__init__(derive_seed(seed, self.path))
+
+    def child(self, *names):
+        return RngStream(self.root_seed, self.path + names)
+
+    def __reduce__(self):
+        # random.Random rebuilds with no arguments; keep seed, path and position for pickling and worker processes
+        return (RngStream, (self.root_seed, self.path), self.getstate())
+
+    def __repr__(self):
+        return f"RngStream(seed={self.root_seed}, path={self.path})"
+
+if __name__ == "__main__":
+    # Round-trip check: a pickled or copied stream continues with the same draws as the original
+    import copy
+    import pickle
+    stream = RngStream(42).child("week", 1)
+    stream.random()
+    clones = [pickle.loads(pickle.dumps(stream)), copy.deepcopy(stream)]
+    expected = [stream.random() for _ in range(5)]
+    for clone in clones:
+        assert (clone.root_seed, clone.path) == (42, ("week", 1))
+        assert [clone.random() for _ in range(5)] == expected
+    print("RngStream round-trip OK")
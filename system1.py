@@ -1,7 +1,12 @@
 import autogen
 from dotenv import load_dotenv
 import os
-import random
+from batch_runner import BatchChat, LocalBatchClient, GeminiBatchClient, run_lockstep, print_transcript
+from negotiation_log import NegotiationRecorder, load_slots, new_run_id, parse_outcome
+from campus_state import CampusState
+from rng_streams import RngStream
+from results_store import ResultsWriter, slot_record, usage_tokens
+from model_router import LITE_MODEL, ModelRouter, SlotContext
 
 # Load environment variables
 load_dotenv()
@@ -31,6 +36,13 @@ CAPACITY = 300  # Hall capacity from report (updated to match congestion limit)
 CLASS_DURATION = 50  # Classes run for 50 minutes (e.g., 8:00-8:50)
 NUM_WEEKS = 1  # Simulate for 1 week only
 SLOTS = [-2, 0, 2]  # Available shifts: early (-2 min), on time (0), late (+2 min)
+BATCH_MODE = os.getenv("BATCH_MODE")  # None for interactive chats, "local" stand-in or "gemini" Batch API
+BATCH_RUNS = int(os.getenv("BATCH_RUNS", "1"))  # Independent runs stepped together in batch mode
+RUN_SEED = int(os.getenv("RUN_SEED", "42"))  # Root of the run -> week -> day/slot RNG streams; batch run n uses RUN_SEED + n - 1
+RECORD_ARCHIVE = os.getenv("RECORD_ARCHIVE")  # Store each slot's transcript and outcome in this archive
+REPLAY_ARCHIVE = os.getenv("REPLAY_ARCHIVE")  # Re-run post-chat policy on recorded slots, no LLM calls
+RESULTS_STORE = os.getenv("RESULTS_STORE")  # Append per-slot outcome records to this columnar store
+MODEL_ROUTING = os.getenv("MODEL_ROUTING")  # Set to route routine turns to LITE_MODEL or rule-based replies (interactive mode)
 
 # Session Attendances (strengths from schedule)
 ATTENDANCES = {
@@ -85,12 +97,9 @@ TIMETABLE = {
     }
 }
 
-# Persistent State
-commitment_history = {}  # (debtor, creditor, slot_day): minutes owed
-reward_scores = {f"C{i}": 0 for i in range(1, 11)}  # Reward points per agent
-violation_counts = {f"C{i}": 0 for i in range(1, 11)}  # Violation counts per agent
-committed_queue = []  # Agents that have committed before
-never_committed_queue = list(reward_scores.keys())  # Agents that have never committed
+# Persistent State: commitments, reward points, violation counts and commitment queues per agent
+state = CampusState(ATTENDANCES)
+router = ModelRouter(llm_config, os.getenv("LITE_MODEL", LITE_MODEL)) if MODEL_ROUTING else None
 
 # Function to update system messages with current state
 def get_b_system_message(estimated_total):
@@ -103,13 +112,15 @@ Then, observe and remind agents if congestion is likely, especially with overlap
 If all agents choose on-time exit, signal catastrophic failure and suggest queue-based reassignment.
 """
 
+def get_b_status_message(estimated_total):
+    """Agent B's routine broadcast when the slot is within the hall limit (used by model routing)"""
+    return f"Current capacity: {CAPACITY} students (hall limit). Estimated total students: {estimated_total}. Within the hall limit, so no congestion is expected."
+
 def get_c_system_message(name, attendance):
-    history_str = "\nCurrent commitments:\n"
-    for (debtor, creditor, slot_day), mins in commitment_history.items():
-        history_str += f"{debtor} owes {creditor} {mins} minutes for {slot_day}.\n"
+    history_str = state.history_str()
     
-    reward = reward_scores[name]
-    violations = violation_counts[name]
+    reward = state.reward(name)
+    violations = state.violation_count(name)
     
     return f"""
 You are Classroom Agent {name} with {attendance} students attending.
@@ -143,95 +154,242 @@ def round_robin_speaker(last_speaker, groupchat):
     next_idx = (current_idx + 1) % len(agents)
     return agents[next_idx]
 
+def iterate_slots():
+    """Yield (week, day, j, slots) in simulation order"""
+    for week in range(1, NUM_WEEKS + 1):
+        for day in TIMETABLE:
+            slots = sorted(TIMETABLE[day].keys())
+            for j in range(len(slots)):
+                yield week, day, j, slots
+
+def get_slot_rng(seed, week, day, slot):
+    """Random stream of one slot, derived from the run seed only"""
+    return RngStream(seed).child("week", week).child(day, slot)
+
+def estimate_slot_total(active_classrooms, slots, j, rng):
+    estimated_total = sum(ATTENDANCES[c] for c in active_classrooms)
+    # Add variability for incoming if consecutive
+    if j + 1 < len(slots) and int(slots[j + 1].split(":")[0]) - int(slots[j].split(":")[0]) == 1:
+        estimated_total += rng.randint(0, 50)  # Incoming students
+    return estimated_total
+
+def get_initial_message(week, day, slot):
+    return f"Start the simulation for Week {week}, {day} {slot} slot. Coordinate to avoid congestion, honor commitments, use rewards/probabilities, and handle queues for failures. Consider overlaps from consecutive {CLASS_DURATION}-minute classes."
+
+def update_state_after_slot(day, slot, active_classrooms, outcome, rng, verbose=True):
+    """Post-simulation: Update state (simulated negotiation outcomes).
+
+    outcome is the parsed negotiation result when recorded; unused by this policy.
+    Returns the slot's commitment and violation counts for the results store.
+    """
+    counts = {"commitments_made": 0, "commitments_fulfilled": 0, "violations": 0}
+    slot_day = f"{slot} {day}"
+    total_active_students = sum(ATTENDANCES[c] for c in active_classrooms)
+    if rng.random() < 0.3 and total_active_students > CAPACITY:  # Simulate catastrophic failure
+        if verbose:
+            print(f"Catastrophic failure detected at {slot_day}. Applying queue reassignment.")
+        if state.never_committed:
+            agent_to_commit = state.commit_random_never_committed(rng)
+            if verbose:
+                print(f"{agent_to_commit} forced to commit from never-committed queue.")
+        elif state.committed_queue:
+            agent_to_commit = state.rotate_committed()
+            if verbose:
+                print(f"{agent_to_commit} rotated from committed queue to commit.")
+    
+    if rng.random() > 0.5:  # Simulate new commitment
+        if active_classrooms:
+            debtor = rng.choice(active_classrooms)
+            creditor = rng.choice(active_classrooms)
+            if debtor != creditor:
+                mins = rng.choice([2])
+                state.add_commitment(debtor, creditor, slot_day, mins)
+                state.add_reward(debtor, -1)
+                state.add_reward(creditor, 1)
+                counts["commitments_made"] += 1
+                if verbose:
+                    print(f"New commitment: {debtor} owes {creditor} {mins} min for {slot_day}.")
+    
+    if rng.random() < 0.2:  # Simulate refusal
+        if active_classrooms:
+            agent = rng.choice(active_classrooms)
+            violations = state.record_violation(agent)
+            state.add_reward(agent, -2)
+            counts["violations"] += 1
+            if violations > 3:
+                if verbose:
+                    print(f"Violation event raised for {agent} at {slot_day}!")
+    
+    if rng.random() > 0.7 and state.commitment_count:  # Simulate honoring
+        keys = state.commitments_for(slot_day)
+        if keys:
+            debtor, creditor = rng.choice(keys)
+            state.clear_commitment(debtor, creditor, slot_day)
+            state.add_reward(debtor, 2)
+            counts["commitments_fulfilled"] += 1
+            if verbose:
+                print(f"Honored commitment: {debtor} cleared debt to {creditor} for {slot_day}.")
+    return counts
+
+def reset_state():
+    """Restore the persistent state to its initial values between independent runs"""
+    state.reset()
+
 # Simulate for each week and slot
-for week in range(1, NUM_WEEKS + 1):
-    for day in TIMETABLE:
-        slots = sorted(TIMETABLE[day].keys())
-        for j, slot in enumerate(slots):
-            active_classrooms = TIMETABLE[day][slot]
-            estimated_total = sum(ATTENDANCES[c] for c in active_classrooms)
-            # Add variability for incoming if consecutive
-            if j + 1 < len(slots) and int(slots[j + 1].split(":")[0]) - int(slot.split(":")[0]) == 1:
-                estimated_total += random.randint(0, 50)  # Incoming students
-            print(f"\n=== Week {week}, {day} {slot} Slot (Active: {', '.join(active_classrooms)}) ===\n")
-            
-            # Ground Agent B
-            b_agent = autogen.AssistantAgent(
-                name="B",
-                system_message=get_b_system_message(estimated_total),
+def run_simulation(seed=RUN_SEED):
+    run_id = new_run_id(seed)
+    recorder = NegotiationRecorder(RECORD_ARCHIVE, run_id=run_id, seed=seed) if RECORD_ARCHIVE else None
+    results = ResultsWriter(RESULTS_STORE) if RESULTS_STORE else None
+    for week, day, j, slots in iterate_slots():
+        slot = slots[j]
+        active_classrooms = TIMETABLE[day][slot]
+        slot_rng = get_slot_rng(seed, week, day, slot)
+        estimated_total = estimate_slot_total(active_classrooms, slots, j, slot_rng.child("incoming"))
+        print(f"\n=== Week {week}, {day} {slot} Slot (Active: {', '.join(active_classrooms)}) ===\n")
+        
+        # Ground Agent B
+        b_agent = autogen.AssistantAgent(
+            name="B",
+            system_message=get_b_system_message(estimated_total),
+            llm_config=llm_config,
+        )
+        
+        # Create active classroom agents dynamically
+        active_c_agents = []
+        for name in active_classrooms:
+            c_agent = autogen.AssistantAgent(
+                name=name,
+                system_message=get_c_system_message(name, ATTENDANCES[name]),
                 llm_config=llm_config,
             )
-            
-            # Create active classroom agents dynamically
-            active_c_agents = []
-            for name in active_classrooms:
-                c_agent = autogen.AssistantAgent(
-                    name=name,
-                    system_message=get_c_system_message(name, ATTENDANCES[name]),
-                    llm_config=llm_config,
-                )
-                active_c_agents.append(c_agent)
-            
-            # Group Chat Setup
-            groupchat = autogen.GroupChat(
-                agents=[b_agent] + active_c_agents,
-                messages=[],
-                max_round=12,
-                speaker_selection_method=round_robin_speaker,
+            active_c_agents.append(c_agent)
+        
+        # Group Chat Setup
+        groupchat = autogen.GroupChat(
+            agents=[b_agent] + active_c_agents,
+            messages=[],
+            max_round=12,
+            speaker_selection_method=round_robin_speaker,
+        )
+        
+        # Group Chat Manager
+        manager = autogen.GroupChatManager(
+            groupchat=groupchat,
+            llm_config=router.lite_llm_config if router else llm_config,
+        )
+        if router:
+            slot_context = SlotContext(
+                f"W{week} {day} {slot}", estimated_total, CAPACITY,
+                {name: ATTENDANCES[name] for name in active_classrooms}, state.names_with_commitments(),
+                get_b_status_message(estimated_total),
             )
-            
-            # Group Chat Manager
-            manager = autogen.GroupChatManager(
-                groupchat=groupchat,
-                llm_config=llm_config,
-            )
-            
-            # Initiate the Simulation
-            user_proxy.initiate_chat(
-                manager,
-                message=f"Start the simulation for Week {week}, {day} {slot} slot. Coordinate to avoid congestion, honor commitments, use rewards/probabilities, and handle queues for failures. Consider overlaps from consecutive {CLASS_DURATION}-minute classes.",
-            )
-            
-            # Post-simulation: Update state (simulated negotiation outcomes)
-            slot_day = f"{slot} {day}"
-            total_active_students = sum(ATTENDANCES[c] for c in active_classrooms)
-            if random.random() < 0.3 and total_active_students > CAPACITY:  # Simulate catastrophic failure
-                print(f"Catastrophic failure detected at {slot_day}. Applying queue reassignment.")
-                if never_committed_queue:
-                    agent_to_commit = random.choice(never_committed_queue)
-                    never_committed_queue.remove(agent_to_commit)
-                    committed_queue.append(agent_to_commit)
-                    print(f"{agent_to_commit} forced to commit from never-committed queue.")
-                elif committed_queue:
-                    agent_to_commit = committed_queue.pop(0)
-                    committed_queue.append(agent_to_commit)  # Rotate
-                    print(f"{agent_to_commit} rotated from committed queue to commit.")
-            
-            if random.random() > 0.5:  # Simulate new commitment
-                if active_classrooms:
-                    debtor = random.choice(active_classrooms)
-                    creditor = random.choice(active_classrooms)
-                    if debtor != creditor:
-                        mins = random.choice([2])
-                        commitment_history[(debtor, creditor, slot_day)] = commitment_history.get((debtor, creditor, slot_day), 0) + mins
-                        reward_scores[debtor] -= 1
-                        reward_scores[creditor] += 1
-                        print(f"New commitment: {debtor} owes {creditor} {mins} min for {slot_day}.")
-            
-            if random.random() < 0.2:  # Simulate refusal
-                if active_classrooms:
-                    agent = random.choice(active_classrooms)
-                    violation_counts[agent] += 1
-                    reward_scores[agent] -= 2
-                    if violation_counts[agent] > 3:
-                        print(f"Violation event raised for {agent} at {slot_day}!")
-            
-            if random.random() > 0.7 and commitment_history:  # Simulate honoring
-                keys = [k for k in commitment_history if k[2] == slot_day]
-                if keys:
-                    key = random.choice(keys)
-                    del commitment_history[key]
-                    reward_scores[key[0]] += 2
-                    print(f"Honored commitment: {key[0]} cleared debt to {key[1]} for {slot_day}.")
-
-print("\n=== Simulations Complete. Check console for negotiated exits and state updates. ===")
\ No newline at end of file
+            router.attach(groupchat.agents, slot_context)
+        
+        # Initiate the Simulation
+        user_proxy.initiate_chat(
+            manager,
+            message=get_initial_message(week, day, slot),
+        )
+        
+        if recorder:
+            outcome = recorder.record(week, day, slot, active_classrooms, groupchat.messages)
+        else:
+            outcome = parse_outcome(groupchat.messages, active_classrooms)
+        counts = update_state_after_slot(day, slot, active_classrooms, outcome, slot_rng.child("post_chat"))
+        if results:
+            results.append(slot_record(
+                run_id, week, day, slot, {c: ATTENDANCES[c] for c in active_classrooms}, outcome, counts,
+                llm_calls=slot_context.llm_calls if router else len(groupchat.messages) - 1,  # Every message after Admin's opener
+                tokens=usage_tokens(groupchat.agents) + (slot_context.lite_tokens if router else 0),
+            ))
+    
+    if recorder:
+        recorder.close()
+    if results:
+        results.close()
+    if router:
+        router.print_report()
+
+# Batch mode: slot chats never read each other's transcripts, and the post-chat state
+# updates above do not depend on negotiation content. So the state is advanced
+# first (same random streams as run_simulation) while each slot's prompts are
+# captured, then all chats of all runs are stepped forward together.
+def run_batch_simulation(client, num_runs=1, seed=RUN_SEED):
+    batch_id = new_run_id()
+    chats = []
+    slot_keys = []
+    for run in range(1, num_runs + 1):
+        reset_state()
+        run_seed = seed + run - 1
+        for week, day, j, slots in iterate_slots():
+            slot = slots[j]
+            active_classrooms = TIMETABLE[day][slot]
+            slot_rng = get_slot_rng(run_seed, week, day, slot)
+            estimated_total = estimate_slot_total(active_classrooms, slots, j, slot_rng.child("incoming"))
+            agents = [("B", get_b_system_message(estimated_total))]
+            agents += [(name, get_c_system_message(name, ATTENDANCES[name])) for name in active_classrooms]
+            chats.append(BatchChat(f"run{run}-week{week}-{day}-{slot}", agents, get_initial_message(week, day, slot), max_round=12))
+            counts = update_state_after_slot(day, slot, active_classrooms, None, slot_rng.child("post_chat"))
+            slot_keys.append((f"{batch_id}-run{run}-seed{run_seed}", run_seed, week, day, slot, active_classrooms, counts))
+    
+    steps = run_lockstep(chats, client)
+    failed = [chat.chat_id for chat in chats if chat.failed]
+    print(f"\nBatch mode: {len(chats) - len(failed)} slot chats completed in {steps} bulk submissions")
+    if failed:
+        print(f"Failed slot chats (not recorded): {', '.join(failed)}")
+    # Incomplete transcripts stay out of the archive and the results store
+    kept = [(chat, key) for chat, key in zip(chats, slot_keys) if not chat.failed]
+    chats = [chat for chat, _ in kept]
+    slot_keys = [key for _, key in kept]
+    for chat in chats:
+        print(f"\n=== {chat.chat_id} ===\n")
+        print_transcript(chat)
+    
+    if RECORD_ARCHIVE:
+        recorder = NegotiationRecorder(RECORD_ARCHIVE)
+        for chat, (run_id, run_seed, week, day, slot, active_classrooms, _) in zip(chats, slot_keys):
+            recorder.record(week, day, slot, active_classrooms, chat.messages, run_id=run_id, seed=run_seed)
+        recorder.close()
+    
+    if RESULTS_STORE:
+        results = ResultsWriter(RESULTS_STORE)
+        for chat, (run_id, run_seed, week, day, slot, active_classrooms, counts) in zip(chats, slot_keys):
+            outcome = parse_outcome(chat.messages, active_classrooms)
+            results.append(slot_record(
+                run_id, week, day, slot,
+                {c: ATTENDANCES[c] for c in active_classrooms}, outcome, counts,
+                llm_calls=len(chat.messages) - 1, tokens=chat.tokens,
+            ))
+        results.close()
+
+def replay_simulation(records, policy=update_state_after_slot, seed=None, verbose=False):
+    """Feed recorded negotiations of one run through a post-chat policy, with no LLM calls.
+
+    Slot streams are re-derived from the recorded run seed (or seed, if given), so
+    replaying the unmodified policy reproduces the live run's state exactly.
+    """
+    reset_state()
+    for record in records:
+        run_seed = seed if seed is not None else record["seed"]
+        if run_seed is None:
+            run_seed = RUN_SEED
+        slot_rng = get_slot_rng(run_seed, record["week"], record["day"], record["slot"])
+        policy(record["day"], record["slot"], record["active_classrooms"], record["outcome"], slot_rng.child("post_chat"), verbose=verbose)
+    return state.snapshot()
+
+if __name__ == "__main__":
+    if REPLAY_ARCHIVE:
+        records = load_slots(REPLAY_ARCHIVE)
+        for run in sorted({r["run"] for r in records}):
+            print(f"\n=== Replaying run {run} ===\n")
+            result = replay_simulation([r for r in records if r["run"] == run], verbose=True)
+            print(f"Reward scores: {result['reward_scores']}")
+            print(f"Violation counts: {result['violation_counts']}")
+    elif BATCH_MODE == "local":
+        run_batch_simulation(LocalBatchClient(), num_runs=BATCH_RUNS)
+    elif BATCH_MODE == "gemini":
+        run_batch_simulation(GeminiBatchClient(api_key, model=config_list[0]["model"], temperature=llm_config["temperature"]), num_runs=BATCH_RUNS)
+    else:
+        run_simulation()
+
+    print("\n=== Simulations Complete. Check console for negotiated exits and state updates. ===")
@@ -2,6 +2,7 @@ import autogen
 from dotenv import load_dotenv
 import os
 import random
+from model_router import LITE_MODEL, ModelRouter, SlotContext
 
 # environment variables
 load_dotenv()
@@ -25,6 +26,8 @@ llm_config = {
     "config_list": config_list,
     "timeout": 120,
 }
+MODEL_ROUTING = os.getenv("MODEL_ROUTING")  # Set to route routine turns to LITE_MODEL or rule-based replies
+router = ModelRouter(llm_config, os.getenv("LITE_MODEL", LITE_MODEL)) if MODEL_ROUTING else None
 
 # Environment Settings
 CAPACITY = 100  # Max students per batch to avoid congestion
@@ -57,6 +60,10 @@ You are Agent B, monitoring the bottleneck. Start by broadcasting:
 Then, observe and remind agents if congestion is likely to happen, especially with overlapping class ends and starts. Do not negotiate.
 """
 
+def get_b_status_message(estimated_total):
+    """Agent B's routine broadcast when the slot fits one batch (used by model routing)"""
+    return f"Current capacity: {CAPACITY} students per 2-minute batch. Estimated total students: {estimated_total}. Fits in one batch, so no congestion is expected."
+
 def get_c_system_message(name, attendance):
     history_str = "\nCurrent commitments:\n"
     for (debtor, creditor, slot_day), mins in commitment_history.items():
@@ -141,8 +148,13 @@ for week in range(1, NUM_WEEKS + 1):
             # Group Chat Manager
             manager = autogen.GroupChatManager(
                 groupchat=groupchat,
-                llm_config=llm_config,
+                llm_config=router.lite_llm_config if router else llm_config,
             )
+            if router:
+                pending = {name for debtor, creditor, _ in commitment_history for name in (debtor, creditor)}
+                router.attach(groupchat.agents, SlotContext(
+                    f"W{week} {day} {slot}", estimated_total, CAPACITY, ATTENDANCES, pending, get_b_status_message(estimated_total),
+                ))
             
             # Initiate the Simulation
             user_proxy.initiate_chat(
@@ -175,4 +187,7 @@ for week in range(1, NUM_WEEKS + 1):
                     reward_scores[key[0]] += 2
                     print(f"Honored commitment: {key[0]} cleared debt to {key[1]} for {slot_day}.")
 
+if router:
+    router.print_report()
+
 print("\n=== Simulations Complete. Check console for negotiated exits and state updates. ===")
\ No newline at end of file
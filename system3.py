@@ -1,8 +1,13 @@
 import autogen
+import functools
 from dotenv import load_dotenv
 import os
-import random
 import time
+from negotiation_log import NegotiationRecorder, load_slots, new_run_id, parse_outcome
+from profiling import SlotProfiler
+from rng_streams import RngStream
+from results_store import ResultsWriter, slot_record, usage_tokens
+from model_router import LITE_MODEL, ModelRouter, SlotContext
 
 # Environment variables
 load_dotenv()
@@ -32,6 +37,13 @@ BOTTLENECK_CAPACITY = 100  # Pedestrians/cyclists per minute through bottleneck
 CLEARANCE_TIME = 2  # Minutes to clear bottleneck if no congestion
 BATCH_SPACING = 2   # Minutes between batches
 NUM_WEEKS = 2       # Simulate multiple weeks for commitment tracking
+RUN_SEED = int(os.getenv("RUN_SEED", "42"))  # Root of the run -> week -> day/slot -> agent RNG streams
+RECORD_ARCHIVE = os.getenv("RECORD_ARCHIVE")  # Store each slot's transcript and outcome in this archive
+REPLAY_ARCHIVE = os.getenv("REPLAY_ARCHIVE")  # Re-run post-chat policy on recorded slots, no LLM calls
+RESULTS_STORE = os.getenv("RESULTS_STORE")  # Append per-slot outcome records to this columnar store
+MODEL_ROUTING = os.getenv("MODEL_ROUTING")  # Set to route routine turns to LITE_MODEL or rule-based replies
+PROFILE_MODE = os.getenv("PROFILE_MODE")  # None, "timers", "cprofile" or "sampling"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")  # Per-slot .prof files and collapsed stacks
 
 # Classroom Settings
 CLASSROOM_ATTENDANCE = {
@@ -74,6 +86,14 @@ class SystemState:
             "fulfilled": False
         }
         
+    def get_classrooms_with_commitments(self):
+        """Classrooms owing or owed minutes in any unfulfilled commitment"""
+        return {
+            classroom
+            for (debtor, creditor, _, _), details in self.commitments.items() if not details["fulfilled"]
+            for classroom in (debtor, creditor)
+        }
+
     def get_pending_commitments(self, agent, day, slot):
         """Get commitments this agent needs to fulfill"""
         pending = []
@@ -103,6 +123,8 @@ class SystemState:
 
 
 system_state = SystemState()
+profiler = SlotProfiler(PROFILE_MODE, PROFILE_DIR)
+router = ModelRouter(llm_config, os.getenv("LITE_MODEL", LITE_MODEL)) if MODEL_ROUTING else None
 
 def get_agent_b_system_message(active_classrooms, total_students):
     """Agent B monitors the road bottleneck point"""
@@ -135,8 +157,15 @@ Remember: Students need {CLEARANCE_TIME} minutes to clear bottleneck if no conge
 With {total_students} students and {BOTTLENECK_CAPACITY}/min capacity, coordination is {'CRITICAL' if total_students > BOTTLENECK_CAPACITY else 'RECOMMENDED'}.
 """
 
-def get_classroom_agent_system_message(classroom, active_classrooms, day, slot):
-    """Classroom agent with professor consultation capability"""
+def get_agent_b_status_message(total_students):
+    """Agent B's routine report when traffic is within capacity (used by model routing)"""
+    return (
+        f"BOTTLENECK STATUS: Current capacity {system_state.current_bottleneck_flow}/min, Total incoming: {total_students} students. "
+        f"Traffic flow update: incoming traffic is within capacity, no coordination required."
+    )
+
+def get_classroom_agent_system_message(classroom, active_classrooms, day, slot, rng):
+    """Classroom agent with professor consultation capability (rng: this agent's stream)"""
     
     attendance = CLASSROOM_ATTENDANCE[classroom]
     
@@ -145,7 +174,7 @@ def get_classroom_agent_system_message(classroom, active_classrooms, day, slot):
     violations = system_state.violations[classroom]
     
     # Professor personality
-    professor_type = random.choice(["flexible", "strict", "time_conscious"])
+    professor_type = rng.choice(["flexible", "strict", "time_conscious"])
     
     commitment_str = ""
     if pending:
@@ -202,17 +231,17 @@ def calculate_batches_needed(attendance):
     """Calculate how many batches needed based on bottleneck capacity"""
     return max(1, (attendance + BOTTLENECK_CAPACITY - 1) // BOTTLENECK_CAPACITY)
 
-def simulate_professor_decision(classroom, proposal_type):
+def simulate_professor_decision(classroom, proposal_type, rng):
     """Simulate professor's decision on time adjustments"""
     professor_types = ["flexible", "strict", "time_conscious"]
-    prof_type = random.choice(professor_types)
+    prof_type = rng.choice(professor_types)
     
     if prof_type == "flexible":
-        return random.random() < 0.8
+        return rng.random() < 0.8
     elif prof_type == "strict":
-        return random.random() < 0.4
+        return rng.random() < 0.4
     else:  # time_conscious
-        return random.random() < 0.3
+        return rng.random() < 0.3
 
 # User Proxy Agent
 user_proxy = autogen.UserProxyAgent(
@@ -221,8 +250,8 @@ user_proxy = autogen.UserProxyAgent(
     code_execution_config=False,
 )
 
-def custom_speaker_selection(last_speaker, groupchat):
-    """Custom speaker selection to ensure proper flow"""
+def custom_speaker_selection(last_speaker, groupchat, rng):
+    """Custom speaker selection to ensure proper flow (bind rng with functools.partial)"""
     agents = groupchat.agents
     
     # Always start with Agent B for status update
@@ -235,7 +264,7 @@ def custom_speaker_selection(last_speaker, groupchat):
         return classroom_agents[0] if classroom_agents else agents[0]
     
     # Occasionally go back to B for status updates
-    if random.random() < 0.2:  # 20% chance
+    if rng.random() < 0.2:  # 20% chance
         return next((agent for agent in agents if agent.name == "B"), agents[0])
     
     # Otherwise, continue round-robin
@@ -246,73 +275,150 @@ def custom_speaker_selection(last_speaker, groupchat):
     except:
         return agents[0]
 
+def apply_post_chat_policy(state, day, time_slot, active_classrooms, outcome, rng, verbose=True):
+    """Simulate commitment outcomes based on negotiation.
+
+    outcome is the parsed negotiation result (see negotiation_log.parse_outcome) when
+    available; this default policy does not use it, but policy variants can.
+    rng is the slot's stream; each classroom draws from its own child stream.
+    Returns the slot's commitment and violation counts for the results store.
+    """
+    counts = {"commitments_made": 0, "commitments_fulfilled": 0, "violations": 0}
+    for classroom in active_classrooms:
+        classroom_rng = rng.child("post_chat", classroom)
+        # Check commitment fulfillment
+        pending = state.get_pending_commitments(classroom, day, time_slot)
+        for creditor, minutes in pending:
+            prof_agrees = simulate_professor_decision(classroom, "fulfill_commitment", classroom_rng)
+            if prof_agrees and classroom_rng.random() < 0.75:  # 75% fulfillment if professor agrees
+                state.fulfill_commitment(classroom, creditor, day, time_slot)
+                counts["commitments_fulfilled"] += 1
+                if verbose:
+                    print(f"{classroom} fulfilled {minutes}-minute commitment to {creditor}")
+            else:
+                violation_occurred = state.record_violation(classroom)
+                counts["violations"] += 1
+                if verbose:
+                    print(f"{classroom} failed to fulfill commitment to {creditor}")
+                    if violation_occurred:
+                        print(f"Violation Event: {classroom} exceeded 3 violations!")
+        
+        # Create new commitments based on negotiation complexity
+        if len(active_classrooms) > 1 and classroom_rng.random() < 0.5:
+            other_classroom = classroom_rng.choice([c for c in active_classrooms if c != classroom])
+            minutes = classroom_rng.choice([2, 4])
+            state.add_commitment(classroom, other_classroom, day, time_slot, minutes)
+            counts["commitments_made"] += 1
+            if verbose:
+                print(f"New commitment: {classroom} owes {other_classroom} {minutes} minutes")
+    return counts
+
+def print_session_summary(state, total_students):
+    active_commitments = len([c for c in state.commitments.values() if not c['fulfilled']])
+    print(f"\nSession Summary:")
+    print(f"  1. Active commitments: {active_commitments}")
+    print(f"  2. Total violations: {sum(state.violations.values())}")
+    print(f"  3. Bottleneck efficiency: {'Good' if total_students <= BOTTLENECK_CAPACITY else 'Requires coordination'}")
+
 # Main Simulation
-def run_simulation():
+def run_simulation(seed=RUN_SEED):
     print("Multiagent Road Bottleneck Coordination System Started")
+    run_id = new_run_id(seed)
+    recorder = NegotiationRecorder(RECORD_ARCHIVE, run_id=run_id, seed=seed) if RECORD_ARCHIVE else None
+    results = ResultsWriter(RESULTS_STORE) if RESULTS_STORE else None
+    profiler.instrument_llm_calls(autogen.OpenAIWrapper)
+    run_rng = RngStream(seed)
     
-    for week in range(1, NUM_WEEKS + 1):
-        system_state.week_number = week
-        print(f"\nWEEK {week}")
-        
-        for day, schedule in TIMETABLE.items():
-            for time_slot, active_classrooms in schedule.items():
-                
-                # Calculate total students
-                total_students = sum(CLASSROOM_ATTENDANCE[classroom] for classroom in active_classrooms)
-                
-                print(f"\nSimulation: {day} {time_slot}")
-                print(f"Active Classrooms: {active_classrooms}")
-                print(f"Individual Attendance: {[f'{c}({CLASSROOM_ATTENDANCE[c]})' for c in active_classrooms]}")
-                print(f"Total Students: {total_students}")
-                print(f"Bottleneck Capacity: {BOTTLENECK_CAPACITY}/min")
-                
-                # Update bottleneck status
-                system_state.update_bottleneck_status(total_students)
-                
-                # Create Agent B
-                agent_b = autogen.AssistantAgent(
-                    name="B",
-                    system_message=get_agent_b_system_message(active_classrooms, total_students),
-                    llm_config=llm_config,
-                )
-                
-                # Create Classroom Agents
-                classroom_agents = []
-                for classroom in active_classrooms:
-                    agent = autogen.AssistantAgent(
-                        name=classroom,
-                        system_message=get_classroom_agent_system_message(classroom, active_classrooms, day, time_slot),
-                        llm_config=llm_config,
-                    )
-                    classroom_agents.append(agent)
-                
-                # Setup Group Chat
-                all_agents = [agent_b] + classroom_agents
-                groupchat = autogen.GroupChat(
-                    agents=all_agents,
-                    messages=[],
-                    max_round=15,
-                    speaker_selection_method=custom_speaker_selection,
-                )
-                
-                manager = autogen.GroupChatManager(
-                    groupchat=groupchat,
-                    llm_config=llm_config,
-                )
-                
-                # Determine coordination urgency
-                if total_students > BOTTLENECK_CAPACITY * 1.5:
-                    urgency = "Critical - Multiple batches required"
-                    batches_needed = calculate_batches_needed(total_students)
-                elif total_students > BOTTLENECK_CAPACITY:
-                    urgency = "High - Exit times need to spread out"
-                    batches_needed = 2
-                else:
-                    urgency = "Normal - Not much coordination required"
-                    batches_needed = 1
-                
-                # Start simulation
-                initial_message = f"""
+    try:
+        for week in range(1, NUM_WEEKS + 1):
+            week_rng = run_rng.child("week", week)
+            system_state.week_number = week
+            print(f"\nWEEK {week}")
+            
+            for day, schedule in TIMETABLE.items():
+                for time_slot, active_classrooms in schedule.items():
+                    profiler.begin_slot(f"Week {week} {day} {time_slot}")
+                    slot_rng = week_rng.child(day, time_slot)
+                    
+                    # Calculate total students
+                    total_students = sum(CLASSROOM_ATTENDANCE[classroom] for classroom in active_classrooms)
+                    
+                    print(f"\nSimulation: {day} {time_slot}")
+                    print(f"Active Classrooms: {active_classrooms}")
+                    print(f"Individual Attendance: {[f'{c}({CLASSROOM_ATTENDANCE[c]})' for c in active_classrooms]}")
+                    print(f"Total Students: {total_students}")
+                    print(f"Bottleneck Capacity: {BOTTLENECK_CAPACITY}/min")
+                    
+                    # Update bottleneck status
+                    system_state.update_bottleneck_status(total_students)
+                    
+                    # Build system prompts
+                    with profiler.phase("prompt_build"):
+                        b_system_message = get_agent_b_system_message(active_classrooms, total_students)
+                        classroom_system_messages = {
+                            classroom: get_classroom_agent_system_message(
+                                classroom, active_classrooms, day, time_slot, slot_rng.child("agent", classroom)
+                            )
+                            for classroom in active_classrooms
+                        }
+                    
+                    with profiler.phase("agent_construction"):
+                        # Create Agent B
+                        agent_b = autogen.AssistantAgent(
+                            name="B",
+                            system_message=b_system_message,
+                            llm_config=llm_config,
+                        )
+                        
+                        # Create Classroom Agents
+                        classroom_agents = []
+                        for classroom in active_classrooms:
+                            agent = autogen.AssistantAgent(
+                                name=classroom,
+                                system_message=classroom_system_messages[classroom],
+                                llm_config=llm_config,
+                            )
+                            classroom_agents.append(agent)
+                        
+                        # Setup Group Chat
+                        all_agents = [agent_b] + classroom_agents
+                        groupchat = autogen.GroupChat(
+                            agents=all_agents,
+                            messages=[],
+                            max_round=15,
+                            speaker_selection_method=profiler.wrap(
+                                "speaker_selection",
+                                functools.partial(custom_speaker_selection, rng=slot_rng.child("speaker_selection")),
+                            ),
+                        )
+                        
+                        manager = autogen.GroupChatManager(
+                            groupchat=groupchat,
+                            llm_config=router.lite_llm_config if router else llm_config,  # Speakers are chosen by custom_speaker_selection
+                        )
+                        
+                        if router:
+                            slot_context = SlotContext(
+                                f"Week {week} {day} {time_slot}", total_students, BOTTLENECK_CAPACITY,
+                                {c: CLASSROOM_ATTENDANCE[c] for c in active_classrooms},
+                                system_state.get_classrooms_with_commitments(),
+                                get_agent_b_status_message(total_students),
+                            )
+                            router.attach(all_agents, slot_context)
+                    
+                    # Determine coordination urgency
+                    if total_students > BOTTLENECK_CAPACITY * 1.5:
+                        urgency = "Critical - Multiple batches required"
+                        batches_needed = calculate_batches_needed(total_students)
+                    elif total_students > BOTTLENECK_CAPACITY:
+                        urgency = "High - Exit times need to spread out"
+                        batches_needed = 2
+                    else:
+                        urgency = "Normal - Not much coordination required"
+                        batches_needed = 1
+                    
+                    # Start simulation
+                    initial_message = f"""
 Start Bottleneck Coordination Simulation
 
 Scenario: {day} {time_slot} - Week {week}
@@ -337,53 +443,73 @@ Available Time Slots: -4, -2, 0, +2, +4 minutes from scheduled end
 
 Begin Coordination - Agent B start with bottleneck status report
 """
+                    
+                    with profiler.phase("group_chat"):
+                        user_proxy.initiate_chat(manager, message=initial_message)
                 
-                user_proxy.initiate_chat(manager, message=initial_message)
-            
-                print("\nAfter Simulation State:")
-                print("\n \n")
-                
-                # Simulate commitment outcomes based on negotiation
-                for classroom in active_classrooms:
-                    # Check commitment fulfillment
-                    pending = system_state.get_pending_commitments(classroom, day, time_slot)
-                    for creditor, minutes in pending:
-                        prof_agrees = simulate_professor_decision(classroom, "fulfill_commitment")
-                        if prof_agrees and random.random() < 0.75:  # 75% fulfillment if professor agrees
-                            system_state.fulfill_commitment(classroom, creditor, day, time_slot)
-                            print(f"{classroom} fulfilled {minutes}-minute commitment to {creditor}")
+                    print("\nAfter Simulation State:")
+                    print("\n \n")
+                    
+                    with profiler.phase("post_processing"):
+                        if recorder:
+                            outcome = recorder.record(week, day, time_slot, active_classrooms, groupchat.messages)
                         else:
-                            violation_occurred = system_state.record_violation(classroom)
-                            print(f"{classroom} failed to fulfill commitment to {creditor}")
-                            if violation_occurred:
-                                print(f"Violation Event: {classroom} exceeded 3 violations!")
+                            outcome = parse_outcome(groupchat.messages, active_classrooms)
+                        counts = apply_post_chat_policy(system_state, day, time_slot, active_classrooms, outcome, slot_rng)
+                        print_session_summary(system_state, total_students)
+                        if results:
+                            results.append(slot_record(
+                                run_id, week, day, time_slot,
+                                {c: CLASSROOM_ATTENDANCE[c] for c in active_classrooms},
+                                outcome, counts,
+                                llm_calls=slot_context.llm_calls if router else len(groupchat.messages) - 1,  # Every message after Admin's opener
+                                tokens=usage_tokens(all_agents) + (slot_context.lite_tokens if router else 0),
+                            ))
                     
-                    # Create new commitments based on negotiation complexity
-                    if len(active_classrooms) > 1 and random.random() < 0.5:
-                        other_classroom = random.choice([c for c in active_classrooms if c != classroom])
-                        minutes = random.choice([2, 4])
-                        system_state.add_commitment(classroom, other_classroom, day, time_slot, minutes)
-                        print(f"New commitment: {classroom} owes {other_classroom} {minutes} minutes")
-                
-                # Summary stats
-                active_commitments = len([c for c in system_state.commitments.values() if not c['fulfilled']])
-                print(f"\nSession Summary:")
-                print(f"  1. Active commitments: {active_commitments}")
-                print(f"  2. Total violations: {sum(system_state.violations.values())}")
-                print(f"  3. Bottleneck efficiency: {'Good' if total_students <= BOTTLENECK_CAPACITY else 'Requires coordination'}")
-                
-                time.sleep(1)  # Brief pause between simulations
-
-if __name__ == "__main__":
-    run_simulation()
+                    with profiler.phase("sleep"):
+                        time.sleep(1)  # Brief pause between simulations
+                    profiler.end_slot()
+    finally:
+        profiler.end_slot()  # Closes a slot left open by an exception; no-op otherwise
+        profiler.restore_llm_calls()
     
+    if recorder:
+        recorder.close()
+    if results:
+        results.close()
+    if router:
+        router.print_report()
+    if profiler.enabled:
+        profiler.print_report()
+        if profiler.mode == "sampling":
+            profiler.write_collapsed(os.path.join(PROFILE_DIR, "slots.collapsed"))
+
+def replay_simulation(records, policy=apply_post_chat_policy, seed=None, verbose=False):
+    """Feed recorded negotiations of one run through a post-chat policy, with no LLM calls.
+
+    Slot streams are re-derived from the recorded run seed (or seed, if given), so
+    replaying the unmodified policy reproduces the live run's state exactly.
+    """
+    state = SystemState()
+    for record in records:
+        run_seed = seed if seed is not None else record["seed"]
+        if run_seed is None:
+            run_seed = RUN_SEED
+        slot_rng = RngStream(run_seed).child("week", record["week"]).child(record["day"], record["slot"])
+        total_students = sum(CLASSROOM_ATTENDANCE[c] for c in record["active_classrooms"])
+        state.week_number = record["week"]
+        state.update_bottleneck_status(total_students)
+        policy(state, record["day"], record["slot"], record["active_classrooms"], record["outcome"], slot_rng, verbose=verbose)
+    return state
+
+def print_final_report(state):
     print("\n" + "="*70)
     print("Final Report")
     print("="*70)
     
     print(f"\nCommitments:")
-    fulfilled = sum(1 for c in system_state.commitments.values() if c["fulfilled"])
-    total_commitments = len(system_state.commitments)
+    fulfilled = sum(1 for c in state.commitments.values() if c["fulfilled"])
+    total_commitments = len(state.commitments)
     if total_commitments > 0:
         fulfillment_rate = fulfilled/total_commitments*100
         print(f"Total commitments made: {total_commitments}")
@@ -394,7 +520,7 @@ if __name__ == "__main__":
     
     print(f"\nViolations:")
     violations_found = False
-    for agent, violations in system_state.violations.items():
+    for agent, violations in state.violations.items():
         if violations > 0:
             violations_found = True
             print(f"{agent}: {violations} violations {'(CRITICAL - >3)' if violations > 3 else ''}")
@@ -402,8 +528,17 @@ if __name__ == "__main__":
         print("No violations recorded")
     
     print(f"\nRoad Bottleneck:")
-    print(f"Final bottleneck capacity: {system_state.current_bottleneck_flow}/min")
-    print(f"Last simulation load: {system_state.students_in_transit} students")
+    print(f"Final bottleneck capacity: {state.current_bottleneck_flow}/min")
+    print(f"Last simulation load: {state.students_in_transit} students")
 
     print(f"\nMultiagent Coordination Completed Successfully.")
-    
\ No newline at end of file
+
+if __name__ == "__main__":
+    if REPLAY_ARCHIVE:
+        records = load_slots(REPLAY_ARCHIVE)
+        for run in sorted({r["run"] for r in records}):
+            print(f"\nReplaying run {run}")
+            print_final_report(replay_simulation([r for r in records if r["run"] == run], verbose=True))
+    else:
+        run_simulation()
+        print_final_report(system_state)